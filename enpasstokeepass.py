@@ -23,20 +23,39 @@ import datetime
 # This program reads an Enpass JSON export file and converts its contents
 # to an existing Keepass file.
 
-import json
 import os
 import logging
 from pykeepass import PyKeePass
+from pykeepass.entry import Entry
 from pykeepass import __version__ as pykeepass_version
-from shutil import copyfile
-import base64
+from pykeepass.exceptions import (
+    CredentialsError,
+    HeaderChecksumError,
+    PayloadChecksumError,
+)
+from construct import Container
+from binascii import a2b_base64
+import hashlib
 import unicodedata
 import argparse
-from uuid import UUID
+from operator import itemgetter
+import re
 import pytz
 
 pk_reserved_keys = []
-pk_reserved_special_keys = ["otp"]
+pk_reserved_special_keys = frozenset({"otp"})
+
+# Keepass' 'native' core key entries. We also use this table to prevent
+# the creation of 'regular' attributes with these names
+key_categories = frozenset({"username", "email", "password", "url"})
+
+# extracts value, type, label and uid from an Enpass field in one go
+_field_getter = itemgetter("value", "type", "label", "uid")
+
+# canonical (hyphenated) UUID representation
+_uuid_regex = re.compile(
+    r"\A[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\Z", re.IGNORECASE
+)
 
 # get the list of reserved keys from pykeepass whereas
 # present. This is important if the user runs a pykeepass
@@ -49,11 +68,57 @@ try:
 except ImportError:
     pass
 
+# use the fastest JSON parser which is present for parsing the Enpass
+# export file: orjson, ujson and Python's json module (fallback)
+#
+try:
+    import orjson as _json
+except ImportError:
+    try:
+        import ujson as _json
+    except ImportError:
+        import json as _json
+
+# lowercase lookup table for pykeepass' reserved keys
+# key: lowercase reserved key, value: pykeepass' reserved key
+_pk_reserved_lookup = {k.lower(): k for k in pk_reserved_keys}
+
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s %(module)s -%(levelname)s- %(message)s"
 )
 logger = logging.getLogger(__name__)
 
+# number of Enpass items after which we log our progress
+progress_log_interval = 100
+
+# number of base64 characters per chunk when hashing attachments
+digest_chunk_size = 64 * 1024
+
+
+class _ControlCharacterTable(dict):
+    """
+    Translation table for str.translate which maps Unicode control
+    characters (category "C*") to None and all other characters to
+    themselves. The table is populated lazily; every code point is
+    only classified once. Code points which are passed to the
+    constructor are classified up front.
+    """
+
+    def __init__(self, codepoints=()):
+        super().__init__()
+        for codepoint in codepoints:
+            self.__missing__(codepoint)
+
+    def __missing__(self, codepoint: int):
+        value = None if unicodedata.category(chr(codepoint))[0] == "C" else codepoint
+        self[codepoint] = value
+        return value
+
+
+# ASCII and Latin-1 (which includes the C0 and C1 control characters) make
+# up the vast majority of the Enpass field values; classify them right away
+_cc_table = _ControlCharacterTable(range(0x100))
+
 
 def read_enpass_json_file(json_filename: str):
     """
@@ -70,32 +135,21 @@ def read_enpass_json_file(json_filename: str):
     Returns a dict, consisting of the the Enpass JSON export content
 
     """
-    list_lines = None
-
-    # Open the local file and read it
-
-    if os.path.isfile(json_filename):
-        try:
-            with open(f"{json_filename}", "r") as f:
-                if f.mode == "r":
-                    list_lines = f.readlines()
-                    f.close()
-        except:
-            list_lines = None
-    else:
-        logger.info(msg=f"File '{json_filename}' does not exist")
+    # Open the local file and convert its content to a dictionary
+    # The file is read in one go and handed to the parser as bytes
+    # (orjson does not accept file handles). We open the file unbuffered;
+    # the raw file object sizes its read buffer from the file's size and
+    # reads the whole file at once
+    try:
+        with open(json_filename, "rb", buffering=0) as f:
+            return _json.loads(f.read())
+    except FileNotFoundError:
+        logger.error("File '%s' does not exist", json_filename)
+    except (OSError, ValueError):
+        # ValueError covers the JSON decode errors of all supported parsers
+        logger.error("Cannot read file '%s'", json_filename)
 
-    json_content = {}
-    # did we receive any content?
-    if list_lines:
-        # enpass exports single lines; let's join them
-        string_lines = " ".join(list_lines)
-        # Finally, try to convert the content to a dictionary
-        try:
-            json_content = json.loads(string_lines)
-        except:
-            json_content = {}
-    return json_content
+    return {}
 
 
 def remove_control_characters(s: str):
@@ -113,7 +167,11 @@ def remove_control_characters(s: str):
     string without unicode control characters
     """
 
-    return "".join(ch for ch in s if unicodedata.category(ch)[0] != "C")
+    # Fast path: printable strings cannot contain any control characters
+    if s.isprintable():
+        return s
+
+    return s.translate(_cc_table)
 
 
 def is_reserved_word(my_key: str):
@@ -131,12 +189,81 @@ def is_reserved_word(my_key: str):
     'None" if not found, else pykeepass' reserved key
     """
 
-    low_key = my_key.lower()
-    lower_reserved_values = [res.lower() for res in pk_reserved_keys]
-    if low_key in lower_reserved_values:
-        return pk_reserved_keys[lower_reserved_values.index(low_key)]
-    else:
-        return None
+    return _pk_reserved_lookup.get(my_key.lower())
+
+
+def normalize_label(mylabel: str, myuid: int, mytitle: str, value_fields: dict):
+    """
+    Converts an Enpass field label to a Keepass attribute name which
+    neither collides with existing attributes of the entry nor with
+    Keepass' / pykeepass' reserved keys. In case of a collision, the
+    field's uid is attached to the label (at most once)
+
+    Parameters
+    ==========
+    mylabel : 'str'
+        Enpass field label
+    myuid : 'int'
+        Enpass field uid
+    mytitle : 'str'
+        title of the Enpass entry (used for logging purposes)
+    value_fields : 'dict'
+        the attributes that we have already collected for this entry
+
+    Returns
+    =======
+    Keepass attribute name
+    """
+
+    # Enpass field names can be empty; if that is the case, use a fixed
+    # prefix and the field's uid as field name
+    if not mylabel:
+        logger.info(
+            "Empty enpass label name '%s' for entry '%s' detected; assigning 'empty_enpass_label_%s' to keepass target field",
+            mylabel,
+            mytitle,
+            myuid,
+        )
+        return f"empty_enpass_label_{myuid}"
+
+    # label is not empty - this should be our default
+    # If we detect a dupe record, attach the UUID to the label name
+    if mylabel in value_fields:
+        logger.info(
+            "Duplicate enpass label name '%s' for entry '%s' detected; attaching UID '%s' to keepass label",
+            mylabel,
+            mytitle,
+            myuid,
+        )
+        return f"{mylabel}_{myuid}"
+
+    low_label = mylabel.lower()
+
+    # now check if we deal with a reserved key. If applicable
+    # AND the field is not of "otp" value, add the UID
+    # OTP entries are the only ones that we need to keep 'as is'
+    reserved_key = _pk_reserved_lookup.get(low_label)
+    if reserved_key and reserved_key not in pk_reserved_special_keys:
+        logger.info(
+            "Detected reserved key '%s' for entry '%s'; attaching UID '%s' to keepass label",
+            mylabel,
+            mytitle,
+            myuid,
+        )
+        return f"{mylabel}_{myuid}"
+
+    # check if the label that we want to create contains a Keepass keyword
+    # (e.g. password, url). If yes, rename the field accordingly
+    if low_label in key_categories:
+        logger.info(
+            "Reserved word '%s' for entry '%s' detected; attaching UID '%s' to keepass label",
+            low_label,
+            mytitle,
+            myuid,
+        )
+        return f"{mylabel}_{myuid}"
+
+    return mylabel
 
 
 def is_uuid(my_uuid: str):
@@ -153,13 +280,117 @@ def is_uuid(my_uuid: str):
     'False' -> string is no uuid
     'True" -> string is uuid
     """
-    try:
-        UUID(my_uuid)
-        return True
-    except ValueError:
-        pass
+    return _uuid_regex.match(my_uuid) is not None
+
+
+def get_base64_digest(data: str):
+    """
+    Returns the SHA-256 digest of a base64-encoded attachment
+
+    The digest is calculated over the (ASCII) base64 text and not over the
+    decoded content, so that duplicate attachments do not need to be decoded
+    at all. hashlib only accepts bytes; rather than encoding the whole
+    string at once (which would allocate a second buffer of the
+    attachment's size), the text is encoded and hashed in small chunks
+
+    Parameters
+    ==========
+    data : 'str'
+        base64-encoded attachment content
+
+    Returns
+    =======
+    SHA-256 digest of the base64 text
+    """
+    digest = hashlib.sha256()
+    for offset in range(0, len(data), digest_chunk_size):
+        digest.update(data[offset : offset + digest_chunk_size].encode("ascii"))
+    return digest.digest()
 
-    return False
+
+def add_binary(kp: PyKeePass, data: bytes, binary_id: int):
+    """
+    Adds binary data to the Keepass database
+
+    pykeepass' add_binary method determines the id of the new binary
+    by rebuilding its complete list of binaries on every call, which
+    turns the import of n attachments into an O(n^2) operation. For
+    KDBX4 databases, we append the binary to the inner header ourselves
+    and use the id that our caller keeps track of. KDBX3 databases are
+    handed over to pykeepass.
+
+    Note that the KDBX4 path relies on pykeepass' internal layout: the
+    parsed inner header in kp.payload.inner_header.binary (a list of
+    construct Containers) and the leading 'protected' flag byte of each
+    binary's data. This matches pykeepass 4.x; re-check this function
+    whenever pykeepass is upgraded, as that internal structure is not
+    part of pykeepass' public API and may change without notice.
+
+    Parameters
+    ==========
+    kp : 'PyKeePass'
+        our Keepass object
+    data : 'bytes'
+        binary data that we want to add
+    binary_id : 'int'
+        id that the new binary is going to receive (the number of
+        binaries which are already present in the database)
+
+    Returns
+    =======
+    id of the new binary
+    """
+    if kp.version >= (4, 0):
+        # prepend the 'protected' flag byte and append to the inner
+        # header (pykeepass internals, see above)
+        kp.payload.inner_header.binary.append(
+            Container(type="binary", data=b"\x01" + data)
+        )
+        return binary_id
+    else:
+        return kp.add_binary(data=data)
+
+
+def get_or_create_group(kp: PyKeePass, group_cache: dict, group_path: tuple):
+    """
+    Returns the Keepass group for the given path of group names and
+    creates the group (and its parent groups) if it does not exist yet.
+    Each group path is only looked up once and then served from the cache
+
+    Parameters
+    ==========
+    kp : 'PyKeePass'
+        our Keepass object
+    group_cache : 'dict'
+        cache of the groups that have already been looked up
+        key: group path, value: Keepass group
+    group_path : 'tuple'
+        group names, starting below the Keepass root group,
+        e.g. ("login",) or ("finance", "bank")
+
+    Returns
+    =======
+    Keepass group
+    """
+    group = group_cache.get(group_path)
+    if group is None:
+        if len(group_path) > 1:
+            parent_group = get_or_create_group(
+                kp=kp, group_cache=group_cache, group_path=group_path[:-1]
+            )
+        else:
+            parent_group = kp.root_group
+
+        # try to find the group in the keepass file
+        # and create it if it does not exist yet
+        group = kp.find_groups(name=group_path[-1], group=parent_group, first=True)
+        if not group:
+            group = kp.add_group(
+                destination_group=parent_group, group_name=group_path[-1]
+            )
+        group_cache[group_path] = group
+
+    return group
 
 
 def get_command_line_params():
@@ -174,26 +405,36 @@ def get_command_line_params():
         input parameters from command line
     """
     # Get our parameters
-    # Syntax: enpasstokeepass <enpass_export_file> <keepass_target_file> [--password] [--keyfile]
+    # Syntax: enpasstokeepass <enpass_export_file> <keepass_target_file> [--password] [--keyfile] [--quiet | --verbose]
     parser = argparse.ArgumentParser()
-    parser.add_argument(
-        "enpassfile", type=argparse.FileType("r"), help="Enpass Export File"
-    )
+    parser.add_argument("enpassfile", type=str, help="Enpass Export File")
 
-    parser.add_argument(
-        "keepassfile", type=argparse.FileType("r"), help="Keepass target file"
-    )
+    parser.add_argument("keepassfile", type=str, help="Keepass target file")
 
     parser.add_argument("--password", default=None, type=str, help="Keepass password")
     parser.add_argument("--keyfile", default=None, type=str, help="Keepass keyfile")
+    log_level_group = parser.add_mutually_exclusive_group()
+    log_level_group.add_argument(
+        "--quiet", action="store_true", help="Only log warnings and errors"
+    )
+    log_level_group.add_argument(
+        "--verbose", action="store_true", help="Log every processed entry"
+    )
 
     args = parser.parse_args()
 
+    # only check for the files' existence; there is no need to open them here
+    for filename in (args.enpassfile, args.keepassfile):
+        if not os.path.isfile(filename):
+            parser.error(f"File '{filename}' does not exist")
+
     return (
-        args.keepassfile.name,
+        args.keepassfile,
         args.password,
         args.keyfile,
-        args.enpassfile.name,
+        args.enpassfile,
+        args.quiet,
+        args.verbose,
     )
 
 
@@ -204,11 +445,18 @@ if __name__ == "__main__":
         keepass_password,
         keepass_keyfile,
         enpass_export_filename,
+        quiet_mode,
+        verbose_mode,
     ) = get_command_line_params()
 
-    # Keepass' 'native' core key entries. We also use this table to prevent
-    # the creation of 'regular' attributes with these names
-    key_categories = ["username", "email", "password", "url"]
+    # Suppress the info messages or enable the per-entry debug messages
+    # if requested by the user
+    # Note that the log calls defer the formatting of their messages;
+    # suppressed messages are therefore not formatted at all
+    if quiet_mode:
+        logger.setLevel(logging.WARNING)
+    elif verbose_mode:
+        logger.setLevel(logging.DEBUG)
 
     # this is our keepass object
     kp = None
@@ -220,8 +468,13 @@ if __name__ == "__main__":
             password=keepass_password,
             keyfile=keepass_keyfile,
         )
-    except:
-        logger.info("Cannot open keepass file")
+    except (
+        OSError,
+        CredentialsError,
+        HeaderChecksumError,
+        PayloadChecksumError,
+    ) as e:
+        logger.error("Cannot open keepass file (%s)", type(e).__name__)
         exit(0)
 
     # read the enpass JSON file and receive its content as a dictionary
@@ -247,28 +500,76 @@ if __name__ == "__main__":
         myitems = json_data["folders"]
 
         for myitem in myitems:
-            if "uuid" in myitem:
-                if "title" in myitem:
-                    # our entry MIGHT be a tag
-                    my_parent_uuid = (
-                        myitem["parent_uuid"] if "parent_uuid" in myitem else ""
-                    )
-
-                    # The entry seems to be a tag if:
-                    # - title is not "Root"
-                    # - parent_uuid is empty
-                    # If these conditions do not apply, our entry might be a (sub)folder
-                    # we will gather these in a different structure in order
-                    # to avoid confusion
-                    if myitem["title"] != "Root" and my_parent_uuid == "":
-                        enpass_tag_directory[myitem["uuid"]] = myitem["title"]
+            folder_uuid = myitem.get("uuid")
+            folder_title = myitem.get("title")
+
+            # our entry MIGHT be a tag
+            # The entry seems to be a tag if:
+            # - title is not "Root"
+            # - parent_uuid is empty
+            # If these conditions do not apply, our entry might be a (sub)folder
+            # we will gather these in a different structure in order
+            # to avoid confusion
+            if (
+                folder_uuid is not None
+                and folder_title is not None
+                and folder_title != "Root"
+                and not myitem.get("parent_uuid")
+            ):
+                enpass_tag_directory[folder_uuid] = folder_title
 
     # start parsing the remainder of the file (our actual data)
     if "items" in json_data:
-        myitems = json_data["items"]
+        # Take the items out of the export's dictionary and consume them one
+        # by one. Once an item has been written to the Keepass database,
+        # nothing references it anymore and its memory (e.g. the base64
+        # encoded attachments) is released right away - and not just at
+        # the end of the import. The list is reversed so that we can pop
+        # the items in their original order from its end
+        myitems = json_data.pop("items")
+        myitems.reverse()
+
+        # Enpass categories repeat across many entries. Remember the Keepass
+        # groups that we have already looked up (or created) so that we don't
+        # have to search the Keepass tree for every single entry
+        # key: (category,) or (category, subcategory), value: Keepass group
+        group_cache = {}
+
+        # titles of the entries which are present in a Keepass group; used
+        # for the duplicate title check.
+        # key: uuid of the Keepass group, value: set of entry titles
+        titles_per_group = {}
+
+        # As the groups are searched recursively, different group paths can
+        # resolve to the very same Keepass group (e.g. ("login",) may find an
+        # existing "finance/login" group). Each path is therefore mapped to
+        # the title set of its group, which all of these paths share
+        # key: group path (see group_cache), value: set of entry titles
+        titles_per_path = {}
+
+        # id of the next binary that we are going to add to the Keepass database
+        next_binary_id = len(kp.binaries)
+
+        # Users tend to attach the same file (e.g. a scan of their ID card)
+        # to several Enpass entries. Identical attachments are stored only
+        # once in the Keepass database and then shared between the entries
+        # key: SHA-256 digest of the base64-encoded attachment,
+        # value: Keepass binary id
+        attachment_cache = {}
+
+        # Instead of logging every single entry, we only report our
+        # progress every progress_log_interval items
+        total_items = len(myitems)
+        processed_items = 0
 
         # iterate through all items from the export file
-        for myitem in myitems:
+        while myitems:
+            myitem = myitems.pop()
+
+            processed_items += 1
+            if processed_items % progress_log_interval == 0:
+                logger.info("Processing item %d of %d", processed_items, total_items)
+
             # This dictionary contains the "native" keepass fields
             # (username, email, password, url)
             # The very FIRST instance of a field type within the enpass
@@ -284,22 +585,26 @@ if __name__ == "__main__":
             value_fields = {}
 
             # Get the Unix timestamp for when the entry was last
-            # updated convert it to a Python DateTime object
+            # updated convert it to a (UTC) Python DateTime object
             updated_at_ux = myitem["updated_at"]
-            updated_at_dt = datetime.datetime.fromtimestamp(updated_at_ux)
+            updated_at_dt = datetime.datetime.fromtimestamp(updated_at_ux, tz=pytz.UTC)
 
             # Get the Unix timestamp for when the entry was
-            # created and convert it to a Python DateTime object
-            created_at_ux = myitem["createdAt"] if "created_at" in myitem else myitem["updated_at"]
-            created_at_dt = datetime.datetime.fromtimestamp(created_at_ux)
+            # created and convert it to a (UTC) Python DateTime object
+            # Fall back to the update timestamp if the creation date is missing
+            created_at_ux = myitem.get("createdAt", updated_at_ux)
+            created_at_dt = datetime.datetime.fromtimestamp(created_at_ux, tz=pytz.UTC)
 
             # Get the template type (Enpass' product category)
             # if the template type ends with '.default', then this is a category
             # without a subcategory
             template_type = myitem["template_type"]
 
+            # Split up the template type into category and subcategory
+            category, separator, subcategory = template_type.partition(".")
+
             # Check if we deal with a default
-            default_category = True if template_type.endswith(".default") else False
+            default_category = subcategory == "default"
 
             # per issue ticket #7, there might be rare cases where Enpass populates
             # this field with a UUID - mainly because of a previous database import
@@ -307,11 +612,7 @@ if __name__ == "__main__":
             # (for my test cases, Enpass had always created separate folders)
             # As a workaround, let's test if the field can be split up and is
             # not a UUID. In any other case, assign a default category to our input
-            if "." in template_type and not is_uuid(template_type):
-                _templates = template_type.split(".")
-                category = _templates[0]
-                subcategory = _templates[1]
-            else:
+            if not separator or is_uuid(template_type):
                 category = "Miscellaneous"
                 subcategory = ""
                 default_category = False
@@ -320,220 +621,216 @@ if __name__ == "__main__":
             mytitle = myitem["title"]
             myuuid = myitem["uuid"]
 
-            logger.info(f"Processing entry '{mytitle}'")
+            logger.debug("Processing entry '%s'", mytitle)
 
             # Get any potential notes that are assigned to this item
             # Enpass always provides this information even if there is no data
             # so let's ensure that we flag this as None if no such data exists
-            mynotes = myitem["note"] if myitem["note"] != "" else None
+            mynotes = myitem.get("note") or None
 
-            # Check if we have any attachments
-            has_attachments = True if "attachments" in myitem else False
+            # Get the attachments (if present)
+            attachments = myitem.get("attachments")
 
             # First start with processing the tags. This is some kind of a backwards
             # approach as the tags are exported AFTER the actual entry
             # Reverse engineering beggars can't be choosers, though
-            tags_to_export = []
-            if "folders" in myitem:
-                for uuid in myitem["folders"]:
-                    if uuid in enpass_tag_directory:
-                        tags_to_export.append(enpass_tag_directory[uuid])
+            tags_to_export = [
+                tag
+                for tag in map(enpass_tag_directory.get, myitem.get("folders", ()))
+                if tag is not None
+            ]
 
             # now iterate through all the individual fields that this record comes with
-            if "fields" in myitem:
-                myfields = myitem["fields"]
-                for myfield in myfields:
-                    myvalue = myfield["value"]
-                    mytype = myfield["type"]
-                    mylabel = myfield["label"]
-                    myuid = myfield["uid"]
-
-                    # the JSON export contains fields even if they are empty
-                    # so let's ensure that we only process the data if there
-                    # actually is something to process
-                    if myvalue != "":
-                        # is the field type email/username etc AND
-                        # we do not have this stored yet
-                        # if yes, then let's consider it a key value
-                        if mytype in key_categories and mytype not in key_fields:
-                            key_fields[mytype] = myvalue
-                        # otherwise, add it to the dictionary
-                        else:
-                            # reflag enpass TOTP entries; Keepass requires this as "otp"
-                            # hint: we assume that there is only one totp entry per record
-                            if mytype == "totp":
-                                mylabel = "otp"
-                            # Enpass field names can be empty; if that is the case, use a fixed
-                            # prefix and the field's uid as field name
-                            if mylabel == "":
-                                logger.info(
-                                    f"Empty enpass label name '{mylabel}' for entry '{mytitle}' detected; assigning 'empty_enpass_label_{myuid}' to keepass target field"
-                                )
-                                mylabel = f"empty_enpass_label_{myuid}"
-                            else:
-                                # label is not empty - this should be our default
-                                # If we detect a dupe record, attach the UUID to the label name
-                                if mylabel in value_fields:
-                                    logger.info(
-                                        f"Duplicate enpass label name '{mylabel}' for entry '{mytitle}' detected; attaching UID '{myuid}' to keepass label"
-                                    )
-                                    mylabel = f"{mylabel}_{myuid}"
-                                # now check if we deal with a reserved key. If applicable
-                                # AND the field is not of "otp" value, add the UID
-                                reserved_key = is_reserved_word(mylabel)
-                                if reserved_key:
-                                    # now let's check if we need to keep the field 'as is'
-                                    # currently, this only applies to OTP entries
-                                    if reserved_key not in pk_reserved_special_keys:
-                                        logger.info(
-                                            f"Detected reserved key '{mylabel}' for entry '{mytitle}'; attaching UID '{myuid}' to keepass label"
-                                        )
-                                        mylabel = f"{mylabel}_{myuid}"
-
-                            # check if the label that we want to create contains a Keepass keyword
-                            # (e.g. password, url). If yes, rename the field accordingly
-                            if mylabel.lower() in key_categories:
-                                logger.info(
-                                    f"Reserved word '{mylabel.lower()}' for entry '{mytitle}' detected; attaching UID '{myuid}' to keepass label"
-                                )
-                                mylabel = f"{mylabel}_{myuid}"
-
-                            # Remove all potential UTF-8 control characters from the field's value
-                            # These settings are not visible in Enpass but would break the Keepass import
-                            myvalue = remove_control_characters(myvalue)
-
-                            # if the uuid'ed label is also a dupe, then we give up
-                            # This could be enhanced with a more sophisticated key
-                            # but as this a quick conversion hack I don't really care
-                            if mylabel in value_fields:
-                                logger.info(
-                                    f"Duplicate enpass label+uuid '{mylabel}' name for entry '{mytitle}' detected; giving up"
-                                )
-                            else:
-                                value_fields[mylabel] = myvalue
+            for myfield in myitem.get("fields", ()):
+                myvalue, mytype, mylabel, myuid = _field_getter(myfield)
+
+                # the JSON export contains fields even if they are empty
+                # so let's ensure that we only process the data if there
+                # actually is something to process
+                if not myvalue:
+                    continue
+
+                # is the field type email/username etc AND
+                # we do not have this stored yet
+                # if yes, then let's consider it a key value
+                if mytype in key_categories and mytype not in key_fields:
+                    key_fields[mytype] = myvalue
+                    continue
+
+                # otherwise, add it to the dictionary
+                # reflag enpass TOTP entries; Keepass requires this as "otp"
+                # hint: we assume that there is only one totp entry per record
+                if mytype == "totp":
+                    mylabel = "otp"
+
+                # get a label which is safe to be used as Keepass attribute name
+                mylabel = normalize_label(
+                    mylabel=mylabel,
+                    myuid=myuid,
+                    mytitle=mytitle,
+                    value_fields=value_fields,
+                )
+
+                # if the uuid'ed label is also a dupe, then we give up
+                # This could be enhanced with a more sophisticated key
+                # but as this a quick conversion hack I don't really care
+                if mylabel in value_fields:
+                    logger.info(
+                        "Duplicate enpass label+uuid '%s' name for entry '%s' detected; giving up",
+                        mylabel,
+                        mytitle,
+                    )
+                    continue
+
+                # Remove all potential UTF-8 control characters from the field's value
+                # These settings are not visible in Enpass but would break the Keepass import
+                value_fields[mylabel] = remove_control_characters(myvalue)
 
             # We have processed the data for one entry - now let's start
             # with writing it to the Keepass file
             #
-            # try to find the main category group in the keepass file
-            # and create it if it does not exist yet
-            root_category = kp.find_groups(
-                name=category, group=kp.root_group, first=True
-            )
-            if not root_category:
-                root_category = kp.add_group(
-                    destination_group=kp.root_group, group_name=category
-                )
-
-            # If we deal with a category that comes with a subcategory,
-            # then check if that subcategory exists and create it
-            # if necessary
-            if not default_category:
-                sub_category = kp.find_groups(
-                    name=subcategory, group=root_category, first=True
-                )
-                if not sub_category:
-                    sub_category = kp.add_group(
-                        destination_group=root_category, group_name=subcategory
-                    )
-            # if our category has no 2nd tier, simply take the root group as
-            # our foundation for creating the entries.
+            # get the Keepass group for our category and (if present) its
+            # subcategory; the groups are created if they do not exist yet
+            # If our category has no 2nd tier, simply take the category's group
+            # as our foundation for creating the entries.
+            if default_category:
+                group_path = (category,)
             else:
-                sub_category = root_category
+                group_path = (category, subcategory)
+            sub_category = get_or_create_group(
+                kp=kp, group_cache=group_cache, group_path=group_path
+            )
 
             # now extract our special key fields from the dict
             # Username and Password can be empty string if the values are not present
-            myusername = key_fields["username"] if "username" in key_fields else ""
-            mypassword = key_fields["password"] if "password" in key_fields else ""
+            myusername = key_fields.get("username", "")
+            mypassword = key_fields.get("password", "")
 
             # Per pykeepass, url and email need to be 'None" if not present
-            myurl = key_fields["url"] if "url" in key_fields else None
-            myemail = key_fields["email"] if "email" in key_fields else None
+            myurl = key_fields.get("url")
+            myemail = key_fields.get("email")
+
+            # Get the titles which are already present in our target group
+            # The set is populated from the Keepass database on first use
+            # and then kept up to date with the entries that we create
+            group_titles = titles_per_path.get(group_path)
+            if group_titles is None:
+                group_uuid = sub_category.uuid
+                group_titles = titles_per_group.get(group_uuid)
+                if group_titles is None:
+                    group_titles = {entry.title for entry in sub_category.entries}
+                    titles_per_group[group_uuid] = group_titles
+                titles_per_path[group_path] = group_titles
 
             # Check if the title already exists in the database
             if mytitle:
-                matches = kp.find_entries_by_title(
-                    title=mytitle, group=sub_category, first=True
-                )
                 # We have found a ducplicate - let's add the uuid to the title
-                if matches:
+                if mytitle in group_titles:
                     logger.info(
-                        f"Duplicate title '{mytitle}' detected; attaching uuid '{myuuid}' to it"
+                        "Duplicate title '%s' detected; attaching uuid '%s' to it",
+                        mytitle,
+                        myuuid,
                     )
                     mytitle = f"{mytitle}_{myuuid}"
 
-                # Check again (potentially with the enhanced title). Create the entry if
-                # it is not present in the Keepass database
-                matches = kp.find_entries_by_title(
-                    title=mytitle, group=sub_category, first=True
+                    # Check again with the enhanced title. As the uuid is unique,
+                    # this can only happen if the export has already been imported
+                    # to the Keepass database before. In that case, we give up
+                    if mytitle in group_titles:
+                        logger.info(
+                            "Duplicate title with uuid '%s' detected; giving up",
+                            mytitle,
+                        )
+                        continue
+
+                # Create the Keepass entry
+                # kp.add_entry() would search the whole group for an entry
+                # with the same title and username on every call, which makes
+                # the import O(n^2) per group. We have already made sure that
+                # the title is unique within the group, so we build the entry
+                # ourselves - the same way that add_entry does after its check
+                newentry = Entry(
+                    title=mytitle,
+                    username=myusername,
+                    password=mypassword,
+                    url=myurl,
+                    notes=mynotes,
+                    tags=tags_to_export,
+                    kp=kp,
                 )
-                # Still a dupe? Then we give up. This should never happen, though
-                if matches:
-                    logger.info(
-                        f"Duplicate title with uuid '{mytitle}' detected; giving up"
-                    )
-                else:
-                    # Create the Keepass entry
-                    newentry = kp.add_entry(
-                        destination_group=sub_category,
-                        title=mytitle,
-                        username=myusername,
-                        password=mypassword,
-                        url=myurl,
-                        notes=mynotes,
-                        tags=tags_to_export,
-                    )
-
-                    # set the original created_at / updated_at
-                    # values from Enpass for our new entry
-                    newentry.ctime = created_at_dt.replace(tzinfo=pytz.UTC)
-                    newentry.mtime = updated_at_dt.replace(tzinfo=pytz.UTC)
-
-                    # Add the extra properties (if present)
-                    for value_field in value_fields:
-                        # starting with pykeepass version 4.0.4, several attributes
-                        # need to be handled differently
-                        #
-                        # First check if the key that we are about to write is~
-                        # a reserved word. Note that the only remaining
-                        # "reserved" key is an OTP entry - all other entries have
-                        # already been amended by their respective uid's
-                        reserved_key = is_reserved_word(my_key=value_field)
-
-                        # No reserved key? Great - write entry as usual and "as is"
-                        if not reserved_key:
-                            newentry.set_custom_property(
-                                key=value_field, value=value_fields[value_field]
-                            )
-                        else:
-                            # We deal with a reserved key which requires us to invoke
-                            # the object's 'setter' method. The ONLY entry that we should
-                            # see here is an "otp" entry. Every other reserved key has
-                            # already been force-amended with the field's uid value.
-                            # Nevertheless, let's keep this method generic in case of
-                            # future changes to pykeepass.
-                            if reserved_key in pk_reserved_special_keys:
-                                setattr(
-                                    newentry, reserved_key, value_fields[value_field]
-                                )
-
-                    # write the attachments (if present)
-                    if has_attachments:
-                        attachments = myitem["attachments"]
-                        for attachment in attachments:
-                            # get the name and the base64-encoded content
-                            myattachmentname = attachment["name"]
-                            myattachmentdata = attachment["data"]
-                            # decode the base64 content
-                            myattachment = base64.b64decode(myattachmentdata)
-                            # add the decoded content to keepass
-                            attachment_id = kp.add_binary(data=myattachment)
-                            # assign the file name to the binary and
-                            # create the logical connection to the main entry
-                            newentry.add_attachment(
-                                id=attachment_id, filename=myattachmentname
+                sub_category.append(newentry)
+                group_titles.add(mytitle)
+
+                # set the original created_at / updated_at
+                # values from Enpass for our new entry
+                newentry.ctime = created_at_dt
+                newentry.mtime = updated_at_dt
+
+                # Add the extra properties (if present)
+                for value_field, value_field_value in value_fields.items():
+                    # starting with pykeepass version 4.0.4, several attributes
+                    # need to be handled differently
+                    #
+                    # First check if the key that we are about to write is~
+                    # a reserved word. Note that the only remaining
+                    # "reserved" key is an OTP entry - all other entries have
+                    # already been amended by their respective uid's
+                    reserved_key = is_reserved_word(my_key=value_field)
+
+                    # No reserved key? Great - write entry as usual and "as is"
+                    if not reserved_key:
+                        newentry.set_custom_property(
+                            key=value_field, value=value_field_value
+                        )
+                    else:
+                        # We deal with a reserved key which requires us to invoke
+                        # the object's 'setter' method. The ONLY entry that we should
+                        # see here is an "otp" entry. Every other reserved key has
+                        # already been force-amended with the field's uid value.
+                        # Nevertheless, let's keep this method generic in case of
+                        # future changes to pykeepass.
+                        if reserved_key in pk_reserved_special_keys:
+                            setattr(newentry, reserved_key, value_field_value)
+
+                # write the attachments (if present)
+                if attachments:
+                    for attachment in attachments:
+                        # get the name and the base64-encoded content
+                        # The content is taken out of the item and our own
+                        # reference to it is dropped as soon as we are done
+                        # with it; this way, its memory is released right
+                        # after it has been decoded (and not just when we
+                        # are done with the whole item or export)
+                        myattachmentname = attachment["name"]
+                        myattachmentdata = attachment.pop("data")
+                        # Check whether we have already added the very same
+                        # content before. Hashing the base64 text rather than
+                        # the decoded bytes lets us skip decoding duplicates
+                        digest = get_base64_digest(data=myattachmentdata)
+                        attachment_id = attachment_cache.get(digest)
+                        if attachment_id is None:
+                            # decode the base64 content. binascii accepts the
+                            # (ASCII) string as is and spares us the wrapper
+                            # overhead of base64.b64decode
+                            attachment_id = add_binary(
+                                kp=kp,
+                                data=a2b_base64(myattachmentdata),
+                                binary_id=next_binary_id,
                             )
+                            next_binary_id = attachment_id + 1
+                            attachment_cache[digest] = attachment_id
+                        del myattachmentdata
+                        # assign the file name to the binary and
+                        # create the logical connection to the main entry
+                        newentry.add_attachment(
+                            id=attachment_id, filename=myattachmentname
+                        )
 
         # Finally, save the keepass database to disc
+        # All entries, groups and attachments have only been added to the
+        # in-memory database so far. This is the one and only place where
+        # the database gets serialized, encrypted and written - do not
+        # save from within the items loop
+        logger.info("Processed %d items", processed_items)
         logger.info("Saving Keepass database")
         kp.save()